@@ -187,6 +187,7 @@ data "aws_iam_policy_document" "ingest_permissions" {
     actions = [
       "s3:PutObject",
       "s3:PutObjectAcl",
+      "s3:AbortMultipartUpload",
     ]
 
     resources = [
@@ -194,6 +195,34 @@ data "aws_iam_policy_document" "ingest_permissions" {
     ]
   }
 
+  statement {
+    sid    = "AllowProcessedRead"
+    effect = "Allow"
+
+    actions = [
+      "s3:GetObject",
+    ]
+
+    resources = [
+      "${aws_s3_bucket.processed.arn}/*",
+    ]
+  }
+
+  # Without ListBucket, S3 answers HEAD/GET on a missing key with 403 instead of
+  # 404, so cache misses would be indistinguishable from real permission failures.
+  statement {
+    sid    = "AllowProcessedList"
+    effect = "Allow"
+
+    actions = [
+      "s3:ListBucket",
+    ]
+
+    resources = [
+      aws_s3_bucket.processed.arn,
+    ]
+  }
+
   statement {
     sid    = "AllowBedrockEmbeddings"
     effect = "Allow"
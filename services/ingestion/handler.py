@@ -1,14 +1,23 @@
+import codecs
 import hashlib
 import json
 import os
 import random
 import re
+import sys
+import tempfile
+import threading
 import time
+from array import array
+from collections import OrderedDict, deque
+from concurrent.futures import Future, ThreadPoolExecutor
 from datetime import datetime, timezone
-from typing import Dict, List
+from typing import BinaryIO, Deque, Dict, Iterable, Iterator, Tuple
 from urllib.parse import unquote_plus
 
 import boto3
+from boto3.exceptions import S3UploadFailedError
+from boto3.s3.transfer import TransferConfig
 from botocore.config import Config
 from botocore.exceptions import BotoCoreError, ClientError
 
@@ -17,12 +26,35 @@ PROCESSED_BUCKET = os.environ["PROCESSED_BUCKET"]
 S3_VECTORS_INDEX = os.environ.get("S3_VECTORS_INDEX", "rag-insurellm-dev-kb")
 S3_VECTORS_NAMESPACE = os.environ.get("S3_VECTORS_NAMESPACE", "default")
 BEDROCK_EMBEDDING_MODEL = os.environ.get("BEDROCK_EMBEDDING_MODEL", "amazon.titan-embed-text-v2:0")
-
-s3_client = boto3.client("s3")
+EMBED_MAX_WORKERS = 16
+FETCH_CHUNK_SIZE = 1 << 20
+# Longest stretch markdown_to_text will hold back waiting for a backtick or fence
+# to close before settling it as if the document ended there.
+CODE_CARRY_LIMIT = FETCH_CHUNK_SIZE
+SPOOL_SIZE = 1 << 20
+# Large documents' vector blobs go up as parallel multipart uploads.
+VECTOR_UPLOAD_CONFIG = TransferConfig(multipart_threshold=8 * 1024 * 1024, max_concurrency=EMBED_MAX_WORKERS)
+# Bump when chunk normalization or the embedding request changes so cached
+# embeddings from the old scheme stop matching.
+EMBEDDING_CACHE_VERSION = "v1"
+EMBED_CACHE_SIZE = 1024
+
+_RE_CODE_BLOCK = re.compile(r"```.*?```", re.DOTALL)
+_RE_INLINE_CODE = re.compile(r"`([^`]*)`")
+
+# Survives across warm invocations of the same container; keyed by content_key.
+_EMBED_CACHE: "OrderedDict[str, array]" = OrderedDict()
+_EMBED_CACHE_LOCK = threading.Lock()
+
+# Embedding workers also read and write the content cache, so size the pool for them.
+s3_client = boto3.client("s3", config=Config(max_pool_connections=EMBED_MAX_WORKERS))
 bedrock_client = boto3.client(
     "bedrock-runtime",
     region_name=os.environ.get("AWS_REGION"),
-    config=Config(retries={"mode": "adaptive", "max_attempts": 10}),
+    config=Config(
+        retries={"mode": "adaptive", "max_attempts": 10},
+        max_pool_connections=EMBED_MAX_WORKERS,
+    ),
 )
 
 
@@ -55,9 +87,7 @@ def process_s3_event(s3_record: Dict):
     doc_id = build_doc_id(bucket, key, version_id, etag)
     print(f"Processing {bucket}/{key} as doc_id={doc_id}")
 
-    document_text = fetch_markdown(bucket, key, version_id)
-    plain_text = markdown_to_text(document_text)
-    chunks = chunk_text(plain_text)
+    segments = fetch_markdown(bucket, key, version_id)
 
     doc_type = infer_doc_type(key)
     source_uri = f"s3://{bucket}/{key}"
@@ -67,93 +97,253 @@ def process_s3_event(s3_record: Dict):
         "doc_id": doc_id,
         "source": {"bucket": bucket, "key": key, "version_id": version_id},
         "created_at": created_at,
-        "chunks": [],
+        "chunks_key": manifest_chunks_key(doc_id),
     }
+    manifest_digest = hashlib.sha256(_stable_json(manifest))
+
+    vectors_stored = vector_exists(vector_object_key(doc_id))
+    if vectors_stored:
+        print(f"Vectors already exist for {doc_id}, skipping embed")
+
+    # Manifest entries, vector metadata and packed embedding rows are spooled as each
+    # chunk is seen, spilling to disk past SPOOL_SIZE, instead of accumulating in lists.
+    with (
+        tempfile.SpooledTemporaryFile(max_size=SPOOL_SIZE) as chunk_log,
+        tempfile.SpooledTemporaryFile(max_size=SPOOL_SIZE) as vector_metadata,
+        tempfile.SpooledTemporaryFile(max_size=SPOOL_SIZE) as vector_rows,
+    ):
+        # Embeddings are submitted as chunks come off the stream, so Bedrock calls run
+        # while the rest of the document is still downloading and being chunked.
+        executor = ThreadPoolExecutor(max_workers=EMBED_MAX_WORKERS)
+        # Caps embeds in flight so chunking waits on Bedrock instead of queueing the
+        # whole document's text in the executor.
+        in_flight = threading.BoundedSemaphore(2 * EMBED_MAX_WORKERS)
+        # Set by the first failed embed so chunking stops submitting more work.
+        embed_failed = threading.Event()
+
+        def embed_done(future: Future) -> None:
+            in_flight.release()
+            if not future.cancelled() and future.exception() is not None:
+                embed_failed.set()
+
+        # Embeds in chunk order; each row is written once it and every earlier one finish.
+        pending: Deque[Tuple[str, Future]] = deque()
+        # Repeated boilerplate (headers, disclaimers) is embedded once per document.
+        embeds_by_content: Dict[str, Future] = {}
+        vector_count = 0
+        dim = 0
+
+        def write_finished_rows(wait: bool) -> None:
+            nonlocal vector_count, dim
+            while pending and (wait or pending[0][1].done()):
+                content_hash, future = pending.popleft()
+                embedding = future.result()
+                if embeds_by_content.get(content_hash) is future:
+                    # Later repeats resubmit and hit the in-memory embedding cache.
+                    del embeds_by_content[content_hash]
+                if not vector_count:
+                    dim = len(embedding)
+                elif len(embedding) != dim:
+                    raise RuntimeError(f"Embeddings for {doc_id} have mixed dimensions")
+                vector_rows.write(pack_embedding(embedding))
+                vector_count += 1
 
-    for idx, chunk in enumerate(chunks):
-        chunk_id = f"{doc_id}:{idx}"
-        vector_key = vector_object_key(chunk_id)
-        if vector_exists(vector_key):
-            print(f"Vector already exists for {chunk_id}, skipping embed")
-            manifest["chunks"].append(
-                {
+        try:
+            chunk_count = 0
+            for idx, chunk in enumerate(chunk_text(markdown_to_text(segments))):
+                chunk_id = f"{doc_id}:{idx}"
+                chunk_count = idx + 1
+                preview = chunk[:200]
+                if not vectors_stored:
+                    content_hash = content_key(chunk)
+                    future = embeds_by_content.get(content_hash)
+                    if future is None:
+                        in_flight.acquire()
+                        if embed_failed.is_set():
+                            in_flight.release()
+                            break
+                        future = executor.submit(embed_text_cached, chunk, content_hash)
+                        future.add_done_callback(embed_done)
+                        embeds_by_content[content_hash] = future
+                    pending.append((content_hash, future))
+                    metadata = {
+                        "doc_id": doc_id,
+                        "source_s3_uri": source_uri,
+                        "chunk_id": chunk_id,
+                        "doc_type": doc_type,
+                        "created_at": created_at,
+                        "chunk_text_preview": preview,
+                    }
+                    line = {"id": chunk_id, "metadata": metadata}
+                    vector_metadata.write(json.dumps(line, separators=(",", ":")).encode("utf-8") + b"\n")
+                    write_finished_rows(wait=False)
+
+                entry = {
                     "chunk_id": chunk_id,
                     "doc_type": doc_type,
-                    "chunk_text_preview": chunk[:200],
+                    "chunk_text_preview": preview,
                     "source_s3_uri": source_uri,
                     "length": len(chunk),
                     "created_at": created_at,
                 }
-            )
-            continue
-
-        metadata = {
-            "doc_id": doc_id,
-            "source_s3_uri": source_uri,
-            "chunk_id": chunk_id,
-            "doc_type": doc_type,
-            "created_at": created_at,
-            "chunk_text_preview": chunk[:200],
-        }
-
-        embedding = embed_text(chunk)
-        store_vector(chunk_id, embedding, metadata)
-
-        manifest["chunks"].append(
-            {
-                "chunk_id": chunk_id,
-                "doc_type": doc_type,
-                "chunk_text_preview": chunk[:200],
-                "source_s3_uri": source_uri,
-                "length": len(chunk),
-                "created_at": created_at,
-            }
-        )
+                chunk_log.write(json.dumps(entry, separators=(",", ":")).encode("utf-8") + b"\n")
+                manifest_digest.update(_stable_json(entry))
+
+            write_finished_rows(wait=True)
+        finally:
+            # On failure, drop queued embeds instead of running them for nothing.
+            executor.shutdown(cancel_futures=True)
+
+        if vector_count:
+            store_vectors(doc_id, vector_rows, vector_metadata, vector_count, dim)
 
-    put_manifest(doc_id, manifest)
-    print(f"Completed doc_id={doc_id} with {len(chunks)} chunks")
+        manifest["chunk_count"] = chunk_count
+        put_manifest(doc_id, manifest, chunk_log, manifest_digest.hexdigest())
+    print(f"Completed doc_id={doc_id} with {chunk_count} chunks")
 
 
 def build_doc_id(bucket: str, key: str, version_id: str | None, etag: str | None) -> str:
     token = version_id or etag or ""
-    base = f"{bucket}:{key}:{token}"
-    return hashlib.sha256(base.encode("utf-8")).hexdigest()
+    # Bucket names, version ids and ETags are ASCII; only the key needs UTF-8.
+    digest = hashlib.sha256(bucket.encode("ascii"))
+    digest.update(b":")
+    digest.update(key.encode("utf-8"))
+    digest.update(b":")
+    digest.update(token.encode("ascii"))
+    return digest.hexdigest()
 
 
-def fetch_markdown(bucket: str, key: str, version_id: str | None) -> str:
+def fetch_markdown(bucket: str, key: str, version_id: str | None) -> Iterator[str]:
     try:
         params = {"Bucket": bucket, "Key": key}
         if version_id:
             params["VersionId"] = version_id
         response = s3_client.get_object(**params)
-        return response["Body"].read().decode("utf-8")
     except (ClientError, BotoCoreError) as exc:
         raise RuntimeError(f"Failed to fetch {bucket}/{key}: {exc}") from exc
+    return _decode_stream(response["Body"], f"{bucket}/{key}")
 
 
-def markdown_to_text(markdown: str) -> str:
-    without_code_blocks = re.sub(r"```.*?```", "", markdown, flags=re.DOTALL)
-    without_inline_code = re.sub(r"`([^`]*)`", r"\1", without_code_blocks)
-    collapsed = re.sub(r"\n{3,}", "\n\n", without_inline_code)
-    return collapsed.strip()
-
-
-def chunk_text(text: str, chunk_size: int = 1200, overlap: int = 200) -> List[str]:
-    if not text:
-        return []
-    chunks: List[str] = []
-    start = 0
-    text_length = len(text)
-    while start < text_length:
-        end = min(start + chunk_size, text_length)
-        chunks.append(text[start:end])
-        if end == text_length:
-            break
-        start = end - overlap
-    return chunks
+def _decode_stream(body, source: str) -> Iterator[str]:
+    # Decode the object window by window so the raw bytes and the decoded text
+    # are never both held in full.
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    try:
+        for raw in body.iter_chunks(chunk_size=FETCH_CHUNK_SIZE):
+            segment = decoder.decode(raw)
+            if segment:
+                yield segment
+    except (ClientError, BotoCoreError) as exc:
+        raise RuntimeError(f"Failed to fetch {source}: {exc}") from exc
+    tail = decoder.decode(b"", final=True)
+    if tail:
+        yield tail
 
 
-def embed_text(text: str) -> List[float]:
+def markdown_to_text(segments: Iterable[str]) -> Iterator[str]:
+    """
+    Streams plain text out of markdown segments. Produces the same text as removing
+    fenced blocks, then unwrapping inline code, then collapsing blank lines over the
+    whole document and strip(), unless a backtick or fence stays open for more than
+    CODE_CARRY_LIMIT characters.
+    """
+    without_fences = _stream_strip(segments, _strip_fences)
+    held = ""
+    started = False
+    for stripped in _stream_strip(without_fences, _strip_inline_code):
+        text = _collapse_blank_lines(held + stripped)
+        if not started:
+            text = text.lstrip()
+        body = text.rstrip()
+        # Trailing whitespace waits for the next segment: it may join a longer
+        # blank run or turn out to be the end of the document.
+        held = text[len(body) :]
+        if body:
+            started = True
+            yield body
+
+
+def _stream_strip(segments: Iterable[str], strip) -> Iterator[str]:
+    # Runs strip(text, final) over a stream, carrying forward the tail it cannot
+    # settle until more text arrives.
+    pending = ""
+    for segment in segments:
+        stripped, pending = strip(pending + segment, final=False)
+        if len(pending) > CODE_CARRY_LIMIT:
+            # Nothing closed it within a window: settle the carry now so it isn't
+            # rescanned with every later segment or held until EOF.
+            stripped += strip(pending, final=True)[0]
+            pending = ""
+        if stripped:
+            yield stripped
+    stripped, _ = strip(pending, final=True)
+    if stripped:
+        yield stripped
+
+
+def _collapse_blank_lines(text: str) -> str:
+    # Same result as re.sub(r"\n{3,}", "\n\n", text). Each replace pass shortens
+    # every run of 3+ newlines, and str.replace is a C memory scan.
+    while "\n\n\n" in text:
+        text = text.replace("\n\n\n", "\n\n")
+    return text
+
+
+def _strip_fences(text: str, final: bool) -> Tuple[str, str]:
+    """
+    Drops fenced blocks from text and returns (stripped, tail). Unless final, the tail
+    starts at a fence that hasn't closed yet, or at trailing backticks that may open
+    one once more text is appended.
+    """
+    parts = []
+    pos = 0
+    for match in _RE_CODE_BLOCK.finditer(text):
+        parts.append(text[pos : match.start()])
+        pos = match.end()
+    cut = len(text)
+    if not final:
+        opener = text.find("```", pos)
+        cut = opener if opener != -1 else max(pos, len(text.rstrip("`")))
+    parts.append(text[pos:cut])
+    return "".join(parts), text[cut:]
+
+
+def _strip_inline_code(text: str, final: bool) -> Tuple[str, str]:
+    """
+    Unwraps inline code in fence-free text and returns (stripped, tail). Unless final,
+    the tail starts at a backtick still waiting for its partner.
+    """
+    parts = []
+    pos = 0
+    for match in _RE_INLINE_CODE.finditer(text):
+        parts.append(text[pos : match.start()])
+        parts.append(match.group(1))
+        pos = match.end()
+    cut = len(text)
+    if not final:
+        stray = text.find("`", pos)
+        if stray != -1:
+            cut = stray
+    parts.append(text[pos:cut])
+    return "".join(parts), text[cut:]
+
+
+def chunk_text(segments: Iterable[str], chunk_size: int = 1200, overlap: int = 200) -> Iterator[str]:
+    buffer = ""
+    for segment in segments:
+        buffer += segment
+        start = 0
+        # A chunk that reaches the end of the buffer is held back until we know
+        # whether more text follows it.
+        while len(buffer) - start > chunk_size:
+            yield buffer[start : start + chunk_size]
+            start += chunk_size - overlap
+        buffer = buffer[start:]
+    if buffer:
+        yield buffer
+
+
+def embed_text(text: str) -> array:
     payload = json.dumps({"inputText": text})
     max_retries = 8
     base_delay = 0.5
@@ -165,8 +355,8 @@ def embed_text(text: str) -> List[float]:
             embedding = body.get("embedding") or body.get("vector")
             if not embedding:
                 raise RuntimeError("Embedding response missing vector")
-            time.sleep(random.uniform(0.05, 0.15))
-            return embedding
+            # Hold the vector as one float32 buffer rather than a list of Python floats.
+            return array("f", embedding)
         except ClientError as exc:
             error_code = exc.response.get("Error", {}).get("Code")
             if error_code == "ThrottlingException" and attempt < max_retries - 1:
@@ -179,32 +369,143 @@ def embed_text(text: str) -> List[float]:
             raise RuntimeError(f"Failed to embed text with model {BEDROCK_EMBEDDING_MODEL}: {exc}") from exc
 
 
-def store_vector(chunk_id: str, embedding: List[float], metadata: Dict):
+def embed_text_cached(text: str, content_hash: str) -> array:
+    # Identical chunk text under the same model reuses the stored embedding, across
+    # documents and across versions of the same document.
+    embedding = _memory_cache_get(content_hash)
+    if embedding is not None:
+        return embedding
+    embedding = fetch_cached_embedding(content_hash)
+    if embedding is None:
+        embedding = embed_text(text)
+        store_cached_embedding(content_hash, embedding)
+    _memory_cache_put(content_hash, embedding)
+    return embedding
+
+
+def _memory_cache_get(content_hash: str) -> array | None:
+    with _EMBED_CACHE_LOCK:
+        embedding = _EMBED_CACHE.get(content_hash)
+        if embedding is not None:
+            _EMBED_CACHE.move_to_end(content_hash)
+        return embedding
+
+
+def _memory_cache_put(content_hash: str, embedding: array):
+    with _EMBED_CACHE_LOCK:
+        _EMBED_CACHE[content_hash] = embedding
+        _EMBED_CACHE.move_to_end(content_hash)
+        if len(_EMBED_CACHE) > EMBED_CACHE_SIZE:
+            _EMBED_CACHE.popitem(last=False)
+
+
+def store_vectors(doc_id: str, rows: BinaryIO, metadata: BinaryIO, count: int, dim: int):
     """
-    Placeholder for S3 Vectors upsert. Writes payload to the processed bucket so we
-    have an auditable artifact until native S3 Vectors APIs are wired in.
+    Placeholder for S3 Vectors upsert. Writes all of a document's embeddings as one
+    packed float32 matrix (row i is chunk i), their metadata as JSON lines, and a small
+    JSON sidecar to the processed bucket so we have an auditable artifact until native
+    S3 Vectors APIs are wired in. The sidecar goes last and marks the document's
+    vectors complete.
     """
-    key = vector_object_key(chunk_id)
-    payload = {
-        "id": chunk_id,
+    sidecar = {
+        "doc_id": doc_id,
         "index": S3_VECTORS_INDEX,
         "namespace": S3_VECTORS_NAMESPACE,
-        "embedding": embedding,
-        "metadata": metadata,
+        "dim": dim,
+        "dtype": "<f4",
+        "count": count,
+        "chunks_key": vector_metadata_key(doc_id),
     }
+    rows.seek(0)
+    metadata.seek(0)
     try:
+        s3_client.upload_fileobj(
+            rows,
+            PROCESSED_BUCKET,
+            vector_data_key(doc_id),
+            ExtraArgs={"ContentType": "application/octet-stream"},
+            Config=VECTOR_UPLOAD_CONFIG,
+        )
         s3_client.put_object(
             Bucket=PROCESSED_BUCKET,
-            Key=key,
-            Body=json.dumps(payload).encode("utf-8"),
+            Key=vector_metadata_key(doc_id),
+            Body=metadata,
+            ContentType="application/x-ndjson",
+        )
+        s3_client.put_object(
+            Bucket=PROCESSED_BUCKET,
+            Key=vector_object_key(doc_id),
+            Body=json.dumps(sidecar, separators=(",", ":")).encode("utf-8"),
             ContentType="application/json",
         )
+    except (ClientError, BotoCoreError, S3UploadFailedError) as exc:
+        raise RuntimeError(f"Failed to store vectors for {doc_id}: {exc}") from exc
+
+
+def pack_embedding(embedding: array) -> bytes:
+    # Little-endian float32: 4 bytes per dimension instead of ~20 as JSON text.
+    if sys.byteorder == "big":
+        embedding = array("f", embedding)
+        embedding.byteswap()
+    return embedding.tobytes()
+
+
+def unpack_embedding(data: bytes) -> array:
+    embedding = array("f")
+    embedding.frombytes(data)
+    if sys.byteorder == "big":
+        embedding.byteswap()
+    return embedding
+
+
+def content_key(text: str) -> str:
+    fingerprint = f"{BEDROCK_EMBEDDING_MODEL}|{EMBEDDING_CACHE_VERSION}|{text}"
+    return hashlib.sha256(fingerprint.encode("utf-8")).hexdigest()
+
+
+def content_object_key(content_hash: str) -> str:
+    return f"content/{content_hash}.f32"
+
+
+def fetch_cached_embedding(content_hash: str) -> array | None:
+    key = content_object_key(content_hash)
+    try:
+        response = s3_client.get_object(Bucket=PROCESSED_BUCKET, Key=key)
+        return unpack_embedding(response["Body"].read())
+    except ClientError as exc:
+        error_code = exc.response.get("Error", {}).get("Code")
+        if error_code in {"404", "NoSuchKey", "NotFound"}:
+            return None
+        if error_code in {"403", "AccessDenied", "Forbidden"}:
+            print(f"Warning: access denied reading {key} in processed bucket; treating as missing")
+            return None
+        raise RuntimeError(f"Failed to read cached embedding {content_hash}: {exc}") from exc
+    except (BotoCoreError, ValueError) as exc:
+        raise RuntimeError(f"Failed to read cached embedding {content_hash}: {exc}") from exc
+
+
+def store_cached_embedding(content_hash: str, embedding: array):
+    try:
+        s3_client.put_object(
+            Bucket=PROCESSED_BUCKET,
+            Key=content_object_key(content_hash),
+            Body=pack_embedding(embedding),
+            ContentType="application/octet-stream",
+        )
     except (ClientError, BotoCoreError) as exc:
-        raise RuntimeError(f"Failed to store vector {chunk_id}: {exc}") from exc
+        raise RuntimeError(f"Failed to store cached embedding {content_hash}: {exc}") from exc
+
+
+def vector_object_key(doc_id: str) -> str:
+    return f"vectors/{S3_VECTORS_INDEX}/{S3_VECTORS_NAMESPACE}/{doc_id}.json"
 
 
-def vector_object_key(chunk_id: str) -> str:
-    return f"vectors/{S3_VECTORS_INDEX}/{S3_VECTORS_NAMESPACE}/{chunk_id}.json"
+def vector_data_key(doc_id: str) -> str:
+    return f"vectors/{S3_VECTORS_INDEX}/{S3_VECTORS_NAMESPACE}/{doc_id}.f32"
+
+
+def vector_metadata_key(doc_id: str) -> str:
+    return f"vectors/{S3_VECTORS_INDEX}/{S3_VECTORS_NAMESPACE}/{doc_id}.jsonl"
 
 
 def vector_exists(key: str) -> bool:
@@ -227,19 +528,64 @@ def vector_exists(key: str) -> bool:
         raise
 
 
-def put_manifest(doc_id: str, manifest: Dict):
-    key = f"processed/{doc_id}/chunks.json"
+def put_manifest(doc_id: str, manifest: Dict, chunk_log: BinaryIO, content_hash: str):
+    """
+    Writes the chunk entries as JSON lines, then the small index that points at them.
+    The index goes last and carries the content hash, so a redelivered event whose
+    manifest is unchanged skips both writes.
+    """
+    key = manifest_key(doc_id)
+    if stored_manifest_hash(key) == content_hash:
+        print(f"Manifest for {doc_id} unchanged, skipping write")
+        return
+    chunk_log.seek(0)
     try:
+        s3_client.put_object(
+            Bucket=PROCESSED_BUCKET,
+            Key=manifest_chunks_key(doc_id),
+            Body=chunk_log,
+            ContentType="application/x-ndjson",
+        )
         s3_client.put_object(
             Bucket=PROCESSED_BUCKET,
             Key=key,
             Body=json.dumps(manifest, separators=(",", ":")).encode("utf-8"),
             ContentType="application/json",
+            Metadata={"content-sha256": content_hash},
         )
     except (ClientError, BotoCoreError) as exc:
         raise RuntimeError(f"Failed to write manifest for {doc_id}: {exc}") from exc
 
 
+def manifest_key(doc_id: str) -> str:
+    return f"processed/{doc_id}/manifest.json"
+
+
+def manifest_chunks_key(doc_id: str) -> str:
+    return f"processed/{doc_id}/chunks.jsonl"
+
+
+def _stable_json(entry: Dict) -> bytes:
+    # created_at is stamped per run, so it stays out of the manifest content hash;
+    # otherwise a redelivered event would never match the manifest it already wrote.
+    stable = {name: value for name, value in entry.items() if name != "created_at"}
+    return json.dumps(stable, separators=(",", ":"), sort_keys=True).encode("utf-8")
+
+
+def stored_manifest_hash(key: str) -> str | None:
+    try:
+        response = s3_client.head_object(Bucket=PROCESSED_BUCKET, Key=key)
+        return response.get("Metadata", {}).get("content-sha256")
+    except ClientError as exc:
+        error_code = exc.response.get("Error", {}).get("Code")
+        if error_code in {"404", "NoSuchKey", "NotFound"}:
+            return None
+        if error_code in {"403", "AccessDenied", "Forbidden"}:
+            print(f"Warning: access denied checking {key} in processed bucket; rewriting")
+            return None
+        raise
+
+
 def infer_doc_type(key: str) -> str:
     prefix = key.split("/", 1)[0]
     return prefix if prefix in {"company", "contracts", "employees", "products"} else "unknown"
@@ -0,0 +1,172 @@
+import io
+import json
+import os
+import sys
+import unittest
+from array import array
+from unittest import mock
+
+os.environ.setdefault("RAW_BUCKET", "raw-bucket")
+os.environ.setdefault("PROCESSED_BUCKET", "processed-bucket")
+os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+os.environ.setdefault("AWS_ACCESS_KEY_ID", "testing")
+os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "testing")
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "services", "ingestion"))
+
+from botocore.response import StreamingBody  # noqa: E402
+from botocore.stub import Stubber  # noqa: E402
+
+import handler  # noqa: E402
+
+S3_RECORD = {"s3": {"bucket": {"name": "raw-bucket"}, "object": {"key": "products/policy.md", "versionId": "v1"}}}
+DOC_ID = handler.build_doc_id("raw-bucket", "products/policy.md", "v1", None)
+
+
+def streaming(data: bytes) -> StreamingBody:
+    return StreamingBody(io.BytesIO(data), len(data))
+
+
+class StubbedClientsTest(unittest.TestCase):
+    def setUp(self):
+        handler._EMBED_CACHE.clear()
+        self.calls = []
+        self.put_bodies = {}
+        self.s3 = Stubber(handler.s3_client)
+        self.bedrock = Stubber(handler.bedrock_client)
+        self.s3.activate()
+        self.bedrock.activate()
+        for client in (handler.s3_client, handler.bedrock_client):
+            client.meta.events.register("before-parameter-build", self.record_call)
+
+    def tearDown(self):
+        for client in (handler.s3_client, handler.bedrock_client):
+            client.meta.events.unregister("before-parameter-build", self.record_call)
+        self.s3.deactivate()
+        self.bedrock.deactivate()
+        handler._EMBED_CACHE.clear()
+
+    def record_call(self, params, model, **kwargs):
+        self.calls.append((model.name, params.get("Key")))
+        if model.name == "PutObject":
+            body = params["Body"]
+            if hasattr(body, "read"):
+                data = body.read()
+                body.seek(0)
+            else:
+                data = body
+            self.put_bodies[params["Key"]] = data
+
+    def add_embed_response(self, embedding: list):
+        body = json.dumps({"embedding": embedding}).encode("utf-8")
+        self.bedrock.add_response("invoke_model", {"body": streaming(body), "contentType": "application/json"})
+
+    def assert_all_stubs_used(self):
+        self.s3.assert_no_pending_responses()
+        self.bedrock.assert_no_pending_responses()
+
+
+class EmbeddingCacheTest(StubbedClientsTest):
+    def test_cache_hit_skips_bedrock(self):
+        content_hash = handler.content_key("deductible")
+        cached = array("f", [0.25, -1.5, 3.0])
+        self.s3.add_response(
+            "get_object",
+            {"Body": streaming(handler.pack_embedding(cached))},
+            {"Bucket": "processed-bucket", "Key": handler.content_object_key(content_hash)},
+        )
+
+        self.assertEqual(handler.embed_text_cached("deductible", content_hash), cached)
+        self.assert_all_stubs_used()
+        self.assertEqual([name for name, _ in self.calls], ["GetObject"])
+
+    def test_miss_reads_then_embeds_then_stores(self):
+        content_hash = handler.content_key("deductible")
+        key = handler.content_object_key(content_hash)
+        self.s3.add_client_error(
+            "get_object",
+            service_error_code="NoSuchKey",
+            http_status_code=404,
+            expected_params={"Bucket": "processed-bucket", "Key": key},
+        )
+        self.add_embed_response([0.25, -1.5, 3.0])
+        self.s3.add_response("put_object", {})
+
+        embedding = handler.embed_text_cached("deductible", content_hash)
+
+        self.assert_all_stubs_used()
+        self.assertEqual(embedding, array("f", [0.25, -1.5, 3.0]))
+        self.assertEqual(self.calls, [("GetObject", key), ("InvokeModel", None), ("PutObject", key)])
+        self.assertEqual(self.put_bodies[key], handler.pack_embedding(embedding))
+        # The next lookup is served from memory without touching S3 or Bedrock.
+        self.assertIs(handler.embed_text_cached("deductible", content_hash), embedding)
+        self.assertEqual(len(self.calls), 3)
+
+    def test_memory_cache_evicts_least_recently_used(self):
+        with mock.patch.object(handler, "EMBED_CACHE_SIZE", 2):
+            handler._memory_cache_put("a", array("f", [1.0]))
+            handler._memory_cache_put("b", array("f", [2.0]))
+            handler._memory_cache_get("a")
+            handler._memory_cache_put("c", array("f", [3.0]))
+
+        self.assertEqual(list(handler._EMBED_CACHE), ["a", "c"])
+        self.assertIsNone(handler._memory_cache_get("b"))
+
+
+class DocumentVectorsTest(StubbedClientsTest):
+    def stub_document(self, markdown: str):
+        self.s3.add_response(
+            "get_object",
+            {"Body": streaming(markdown.encode("utf-8"))},
+            {"Bucket": "raw-bucket", "Key": "products/policy.md", "VersionId": "v1"},
+        )
+        self.s3.add_client_error("head_object", service_error_code="404", http_status_code=404)
+
+    def stub_outputs(self):
+        # Matrix, vector metadata, sidecar; then the manifest check and its two writes.
+        for _ in range(3):
+            self.s3.add_response("put_object", {})
+        self.s3.add_client_error("head_object", service_error_code="404", http_status_code=404)
+        self.s3.add_response("put_object", {})
+        self.s3.add_response("put_object", {})
+
+    def test_duplicate_chunks_share_one_embed(self):
+        markdown = "abcdefghij" * 320
+        chunks = list(handler.chunk_text(handler.markdown_to_text([markdown])))
+        self.assertEqual(len(chunks), 3)
+        self.assertEqual(len(set(chunks)), 1)
+        self.stub_document(markdown)
+        self.s3.add_client_error("get_object", service_error_code="NoSuchKey", http_status_code=404)
+        self.add_embed_response([0.5, 0.25])
+        self.s3.add_response("put_object", {})
+        self.stub_outputs()
+
+        handler.process_s3_event(S3_RECORD)
+
+        self.assert_all_stubs_used()
+        self.assertEqual([name for name, _ in self.calls].count("InvokeModel"), 1)
+        rows = handler.unpack_embedding(self.put_bodies[handler.vector_data_key(DOC_ID)])
+        self.assertEqual(list(rows), [0.5, 0.25] * 3)
+
+    def test_matrix_row_matches_chunk_order(self):
+        markdown = "".join(f"Clause {n:04d} covers water damage. " for n in range(200))
+        chunks = list(handler.chunk_text(handler.markdown_to_text([markdown])))
+        self.assertGreater(len(chunks), 3)
+        for idx, chunk in enumerate(chunks):
+            handler._memory_cache_put(handler.content_key(chunk), array("f", [float(idx), idx + 0.5]))
+        self.stub_document(markdown)
+        self.stub_outputs()
+
+        handler.process_s3_event(S3_RECORD)
+
+        self.assert_all_stubs_used()
+        rows = handler.unpack_embedding(self.put_bodies[handler.vector_data_key(DOC_ID)])
+        for idx in range(len(chunks)):
+            self.assertEqual(list(rows[2 * idx : 2 * idx + 2]), [float(idx), idx + 0.5])
+        sidecar = json.loads(self.put_bodies[handler.vector_object_key(DOC_ID)])
+        self.assertEqual((sidecar["count"], sidecar["dim"]), (len(chunks), 2))
+        metadata = self.put_bodies[handler.vector_metadata_key(DOC_ID)].decode("utf-8").splitlines()
+        self.assertEqual([json.loads(line)["id"] for line in metadata], [f"{DOC_ID}:{i}" for i in range(len(chunks))])
+
+
+if __name__ == "__main__":
+    unittest.main()
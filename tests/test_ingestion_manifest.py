@@ -0,0 +1,100 @@
+import io
+import os
+import sys
+import unittest
+from datetime import datetime, timezone
+from unittest import mock
+
+os.environ.setdefault("RAW_BUCKET", "raw-bucket")
+os.environ.setdefault("PROCESSED_BUCKET", "processed-bucket")
+os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+os.environ.setdefault("AWS_ACCESS_KEY_ID", "testing")
+os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "testing")
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "services", "ingestion"))
+
+from botocore.response import StreamingBody  # noqa: E402
+from botocore.stub import Stubber  # noqa: E402
+
+import handler  # noqa: E402
+
+S3_RECORD = {"s3": {"bucket": {"name": "raw-bucket"}, "object": {"key": "products/policy.md", "versionId": "v1"}}}
+DOC_ID = handler.build_doc_id("raw-bucket", "products/policy.md", "v1", None)
+
+
+def raw_object(markdown: str) -> dict:
+    data = markdown.encode("utf-8")
+    return {"Body": StreamingBody(io.BytesIO(data), len(data))}
+
+
+class ManifestRedeliveryTest(unittest.TestCase):
+    def setUp(self):
+        self.puts = []
+        self.stubber = Stubber(handler.s3_client)
+        self.stubber.activate()
+        handler.s3_client.meta.events.register("before-parameter-build.s3.PutObject", self.record_put)
+
+    def tearDown(self):
+        handler.s3_client.meta.events.unregister("before-parameter-build.s3.PutObject", self.record_put)
+        self.stubber.deactivate()
+
+    def record_put(self, params, **kwargs):
+        self.puts.append((params["Key"], params.get("Metadata")))
+
+    def process(self, markdown: str, stored_hash: str | None, created_at: datetime, writes: bool):
+        # Vectors are already stored, so only the raw read and the two HEADs hit S3
+        # before put_manifest decides whether to write.
+        self.stubber.add_response(
+            "get_object",
+            raw_object(markdown),
+            {"Bucket": "raw-bucket", "Key": "products/policy.md", "VersionId": "v1"},
+        )
+        self.stubber.add_response(
+            "head_object", {}, {"Bucket": "processed-bucket", "Key": handler.vector_object_key(DOC_ID)}
+        )
+        manifest_head = {"Bucket": "processed-bucket", "Key": handler.manifest_key(DOC_ID)}
+        if stored_hash is None:
+            self.stubber.add_client_error(
+                "head_object", service_error_code="404", http_status_code=404, expected_params=manifest_head
+            )
+        else:
+            self.stubber.add_response("head_object", {"Metadata": {"content-sha256": stored_hash}}, manifest_head)
+        if writes:
+            self.stubber.add_response("put_object", {})
+            self.stubber.add_response("put_object", {})
+        with mock.patch.object(handler, "datetime") as clock:
+            clock.now.return_value = created_at
+            handler.process_s3_event(S3_RECORD)
+
+    def first_write(self, markdown: str) -> str:
+        self.process(markdown, None, datetime(2026, 1, 1, tzinfo=timezone.utc), writes=True)
+        self.stubber.assert_no_pending_responses()
+        stored_hash = self.puts[-1][1]["content-sha256"]
+        self.puts.clear()
+        return stored_hash
+
+    def test_redelivered_identical_manifest_is_not_rewritten(self):
+        markdown = "# Policy\n\nCovers `water` damage.\n" * 100
+        stored_hash = self.first_write(markdown)
+
+        self.process(markdown, stored_hash, datetime(2026, 1, 2, tzinfo=timezone.utc), writes=False)
+
+        self.stubber.assert_no_pending_responses()
+        self.assertEqual(self.puts, [])
+
+    def test_changed_entry_rewrites_chunks_then_index(self):
+        markdown = "# Policy\n\nCovers `water` damage.\n" * 100
+        stored_hash = self.first_write(markdown)
+
+        changed = markdown.replace("water", "flood")
+        self.process(changed, stored_hash, datetime(2026, 1, 2, tzinfo=timezone.utc), writes=True)
+
+        self.stubber.assert_no_pending_responses()
+        self.assertEqual(
+            [key for key, _ in self.puts], [handler.manifest_chunks_key(DOC_ID), handler.manifest_key(DOC_ID)]
+        )
+        new_hash = self.puts[1][1]["content-sha256"]
+        self.assertNotEqual(new_hash, stored_hash)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,104 @@
+import os
+import random
+import re
+import sys
+import unittest
+from unittest import mock
+
+os.environ.setdefault("RAW_BUCKET", "raw-bucket")
+os.environ.setdefault("PROCESSED_BUCKET", "processed-bucket")
+os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "services", "ingestion"))
+
+import handler  # noqa: E402
+
+
+def whole_document_text(markdown: str) -> str:
+    # Reference: the original markdown_to_text, applied to the full document.
+    without_code_blocks = re.sub(r"```.*?```", "", markdown, flags=re.DOTALL)
+    without_inline_code = re.sub(r"`([^`]*)`", r"\1", without_code_blocks)
+    return re.sub(r"\n{3,}", "\n\n", without_inline_code).strip()
+
+
+def whole_document_chunks(text: str, chunk_size: int, overlap: int) -> list:
+    chunks = []
+    start = 0
+    while start < len(text):
+        end = min(start + chunk_size, len(text))
+        chunks.append(text[start:end])
+        if end == len(text):
+            break
+        start = end - overlap
+    return chunks
+
+
+def random_segments(rng: random.Random, text: str, max_size: int) -> list:
+    segments = []
+    start = 0
+    while start < len(text):
+        size = rng.randint(1, max_size)
+        segments.append(text[start : start + size])
+        start += size
+    return segments
+
+
+class MarkdownToTextStreamingTest(unittest.TestCase):
+    def test_matches_whole_document_for_random_segmentations(self):
+        rng = random.Random(1739)
+        for _ in range(20000):
+            markdown = "".join(rng.choice("`a\n \t") for _ in range(rng.randint(0, 24)))
+            segments = random_segments(rng, markdown, 6)
+            streamed = "".join(handler.markdown_to_text(segments))
+            self.assertEqual(streamed, whole_document_text(markdown), repr(segments))
+
+    def test_matches_whole_document_for_realistic_markdown(self):
+        rng = random.Random(7)
+        markdown = (
+            "# Policy\n\nUse `claim_id` and `policy_id`.\n\n\n\n```python\nprint('x')\n```\n\nDetails.\n"
+        ) * 200
+        for _ in range(50):
+            segments = random_segments(rng, markdown, 500)
+            self.assertEqual("".join(handler.markdown_to_text(segments)), whole_document_text(markdown))
+
+    def test_fences_are_removed_before_inline_code_pairs(self):
+        markdown = "Escape with ``a`b`` in shell.\n\n```bash\nrm -rf /tmp/cache\nexport TOKEN=abc\n```"
+        streamed = "".join(handler.markdown_to_text([markdown]))
+        self.assertEqual(streamed, whole_document_text(markdown))
+        self.assertNotIn("TOKEN", streamed)
+
+    def test_open_backtick_is_settled_after_carry_limit(self):
+        segments = ["don`t stop\n"] + ["plain text " * 10] * 50
+        consumed = []
+
+        def feed():
+            for segment in segments:
+                consumed.append(segment)
+                yield segment
+
+        with mock.patch.object(handler, "CODE_CARRY_LIMIT", 200):
+            emitted = ""
+            for piece in handler.markdown_to_text(feed()):
+                emitted += piece
+                if "`" in emitted:
+                    break
+        # The unpaired backtick is released within a few segments, not at EOF.
+        self.assertTrue(emitted.startswith("don`t stop"))
+        self.assertLess(len(consumed), 5)
+
+
+class ChunkTextStreamingTest(unittest.TestCase):
+    def test_matches_whole_document_for_random_segmentations(self):
+        rng = random.Random(1200)
+        for _ in range(3000):
+            text = "".join(rng.choice("ab") for _ in range(rng.randint(0, 80)))
+            chunk_size = rng.randint(2, 12)
+            overlap = rng.randint(0, chunk_size - 1)
+            segments = random_segments(rng, text, 15)
+            self.assertEqual(
+                list(handler.chunk_text(segments, chunk_size, overlap)),
+                whole_document_chunks(text, chunk_size, overlap),
+            )
+
+
+if __name__ == "__main__":
+    unittest.main()